@@ -0,0 +1,234 @@
+"""Benchmark the API endpoints against synthetic datasets of increasing size.
+
+Usage:
+    python benchmark.py
+    python benchmark.py --scales small,medium --iterations 10 --output results.json
+
+Each scale uploads a generated CSV and then drives every endpoint through the
+in-process ASGI test client, reporting latency percentiles, peak Python
+allocations and response size per endpoint, plus the peak RSS per scale.
+Each scale runs in a fresh child process so its peak RSS is not inflated by
+earlier, larger scales; the figure includes the interpreter, library imports
+and dataset generation. The Gemini-backed endpoints are skipped since they
+call out to an external API.
+"""
+import argparse
+import json
+import multiprocessing
+import sys
+import time
+import tracemalloc
+from io import StringIO
+
+import numpy as np
+import pandas as pd
+from fastapi.testclient import TestClient
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import main
+import metrics
+
+# rows, columns, share of numeric / categorical / date columns, missing rate.
+# Date columns are written as ISO date strings; /upload does not parse dates,
+# so the backend sees them as object (text) columns alongside the categoricals.
+SCALES = {
+    "small": {"rows": 1_000, "columns": 10, "mix": (0.6, 0.3, 0.1), "missing_rate": 0.01},
+    "medium": {"rows": 50_000, "columns": 20, "mix": (0.6, 0.3, 0.1), "missing_rate": 0.05},
+    "large": {"rows": 250_000, "columns": 40, "mix": (0.5, 0.4, 0.1), "missing_rate": 0.05},
+    "wide": {"rows": 10_000, "columns": 200, "mix": (0.8, 0.2, 0.0), "missing_rate": 0.02},
+    "sparse": {"rows": 50_000, "columns": 20, "mix": (0.6, 0.3, 0.1), "missing_rate": 0.4},
+}
+
+# (method, path, json body, mutates current dataset)
+ENDPOINTS = [
+    ("GET", "/current-stats", None, False),
+    ("GET", "/predictive-insights", None, False),
+    ("GET", "/3d-visualizations", None, False),
+    ("POST", "/filter-data", {"filters": [{"column": "num_0", "operator": "greater_than", "value": 0}]}, True),
+    ("POST", "/clean-data", {"handle_missing": True, "missing_method": "fill_median", "remove_duplicates": True}, True),
+    ("GET", "/export/csv", None, False),
+    ("GET", "/export/excel", None, False),
+    ("GET", "/export/pdf", None, False),
+    ("GET", "/export/pdf-enhanced", None, False),
+]
+
+
+def generate_dataset(rows, columns, mix, missing_rate, seed=42):
+    """Build a DataFrame with the requested shape, dtype mix and missing rate."""
+    rng = np.random.default_rng(seed)
+    n_numeric = max(1, int(round(columns * mix[0])))
+    n_datetime = int(round(columns * mix[2]))
+    n_categorical = max(0, columns - n_numeric - n_datetime)
+
+    data = {}
+    for i in range(n_numeric):
+        if i % 2 == 0:
+            data[f"num_{i}"] = rng.normal(0, 1, rows)
+        else:
+            data[f"num_{i}"] = rng.integers(0, 1000, rows).astype(float)
+    categories = np.array([f"cat_{i}" for i in range(50)])
+    for i in range(n_categorical):
+        data[f"cat_{i}"] = rng.choice(categories, rows)
+    start = np.datetime64("2020-01-01")
+    for i in range(n_datetime):
+        data[f"date_{i}"] = start + rng.integers(0, 365 * 5, rows).astype("timedelta64[D]")
+
+    df = pd.DataFrame(data)
+    if missing_rate > 0:
+        mask = rng.random(df.shape) < missing_rate
+        df = df.mask(mask)
+    return df
+
+
+def to_csv_bytes(df):
+    buffer = StringIO()
+    df.to_csv(buffer, index=False)
+    return buffer.getvalue().encode("utf-8")
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB.
+
+    ru_maxrss never goes down, so this is only meaningful per scale because
+    each scale runs in its own process (see run_scale_in_process).
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and kilobytes on Linux
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def summarize(latencies, sizes, peak_alloc):
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "iterations": len(latencies),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 2),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 2),
+        "max_ms": round(float(latencies_ms.max()), 2),
+        "response_bytes": int(np.median(sizes)),
+        "peak_alloc_mb": round(peak_alloc / (1024 * 1024), 1),
+    }
+
+
+def measure_peak_alloc(call):
+    """Peak Python heap allocated while running call(), in bytes.
+
+    Run as a separate untimed call because tracemalloc slows allocation down.
+    NumPy and pandas buffers are reported to tracemalloc, so this covers
+    DataFrame copies as well as Python objects.
+    """
+    tracemalloc.start()
+    try:
+        call()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def upload(client, csv_bytes):
+    response = client.post("/upload", files={"file": ("benchmark.csv", csv_bytes, "text/csv")})
+    response.raise_for_status()
+    return response
+
+
+def run_scale(client, name, config, iterations):
+    df = generate_dataset(config["rows"], config["columns"], config["mix"], config["missing_rate"])
+    csv_bytes = to_csv_bytes(df)
+    results = {"scale": name, "csv_bytes": len(csv_bytes), "endpoints": {}}
+    results.update({k: v for k, v in config.items() if k != "mix"})
+    results["mix"] = list(config["mix"])
+
+    latencies, sizes = [], []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        response = upload(client, csv_bytes)
+        latencies.append(time.perf_counter() - start)
+        sizes.append(len(response.content))
+    peak_alloc = measure_peak_alloc(lambda: upload(client, csv_bytes))
+    results["endpoints"]["POST /upload"] = summarize(latencies, sizes, peak_alloc)
+
+    for method, path, body, mutates in ENDPOINTS:
+        def call():
+            response = client.request(method, path, json=body)
+            response.raise_for_status()
+            return response
+
+        latencies, sizes = [], []
+        for _ in range(iterations):
+            if mutates:
+                # Restore the full dataset so every iteration sees the same input
+                upload(client, csv_bytes)
+            start = time.perf_counter()
+            response = call()
+            latencies.append(time.perf_counter() - start)
+            sizes.append(len(response.content))
+        if mutates:
+            upload(client, csv_bytes)
+        peak_alloc = measure_peak_alloc(call)
+        results["endpoints"][f"{method} {path}"] = summarize(latencies, sizes, peak_alloc)
+        if mutates:
+            # Leave the generated dataset in place for the endpoints that follow
+            upload(client, csv_bytes)
+
+    results["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+
+def run_scale_in_process(name, iterations):
+    """Run one scale with a fresh app and registry; called in a child process."""
+    metrics.registry.reset()
+    client = TestClient(main.app)
+    return run_scale(client, name, SCALES[name], iterations)
+
+
+def print_results(results):
+    rss = results["peak_rss_mb"]
+    rss = f"{rss:.1f} MB" if rss is not None else "n/a"
+    print(f"\n== {results['scale']}: {results['rows']:,} rows x {results['columns']} columns, "
+          f"missing {results['missing_rate']:.0%}, CSV {results['csv_bytes'] / 1024:.0f} KB, "
+          f"peak RSS {rss} ==")
+    print(f"{'endpoint':<28}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'bytes':>12}{'peak alloc MB':>15}")
+    for endpoint, summary in results["endpoints"].items():
+        print(f"{endpoint:<28}{summary['p50_ms']:>10}{summary['p95_ms']:>10}{summary['p99_ms']:>10}"
+              f"{summary['response_bytes']:>12}{summary['peak_alloc_mb']:>15}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", default="small,medium",
+                        help=f"comma separated scales to run ({', '.join(SCALES)})")
+    parser.add_argument("--iterations", type=int, default=5, help="timed requests per endpoint")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    scales = [s.strip() for s in args.scales.split(",") if s.strip()]
+    unknown = [s for s in scales if s not in SCALES]
+    if unknown:
+        parser.error(f"unknown scale(s): {', '.join(unknown)}")
+
+    # A new spawned process per scale keeps each scale's peak RSS independent
+    context = multiprocessing.get_context("spawn")
+    all_results = []
+    for name in scales:
+        with context.Pool(processes=1) as pool:
+            results = pool.apply(run_scale_in_process, (name, args.iterations))
+        print_results(results)
+        all_results.append(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(all_results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -1,6 +1,7 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Response
+from fastapi import FastAPI, File, UploadFile, HTTPException, Response, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse
+from fastapi.encoders import jsonable_encoder
 import pandas as pd
 import numpy as np
 import json
@@ -29,6 +30,9 @@ import plotly.express as px
 from plotly.offline import plot
 import plotly.io as pio
 from scipy.interpolate import griddata
+import time
+import metrics
+from metrics import span
 
 load_dotenv()
 
@@ -44,6 +48,47 @@ app.add_middleware(
 
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    spans = metrics.start_request()
+    profiler = None
+    if metrics.profiling_enabled(request) and request.url.path != "/metrics":
+        profiler = metrics.start_profiler(request.url.path)
+    
+    response = None
+    profile_file = None
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        # Record the request even when the handler raised, so 500s show up in /metrics
+        duration = time.perf_counter() - start
+        if profiler is not None:
+            profiler.stop()
+        
+        # Label by route template so path parameters don't explode cardinality;
+        # unmatched requests (404/405) share one label so scanners can't either
+        route = request.scope.get("route")
+        path = route.path if route is not None else "<unmatched>"
+        status_code = response.status_code if response is not None else 500
+        size = response.headers.get("content-length") if response is not None else None
+        metrics.registry.observe_request(
+            request.method, path, status_code, duration,
+            int(size) if size is not None else None
+        )
+        for phase, phase_duration in spans:
+            metrics.registry.observe_phase(path, phase, phase_duration)
+        
+        # Written last, after the request is recorded; save() never raises
+        if profiler is not None:
+            profile_file = profiler.save()
+    
+    if profile_file is not None:
+        response.headers["X-Profile-File"] = profile_file
+    if spans:
+        response.headers["Server-Timing"] = metrics.server_timing(spans)
+    return response
+
 # Global variable to store current dataset
 current_df = None
 
@@ -51,6 +96,13 @@ current_df = None
 async def root():
     return {"message": "Data Analysis API is running"}
 
+@app.get("/metrics")
+async def get_metrics():
+    return Response(
+        content=metrics.registry.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
 @app.post("/upload")
 async def upload_csv(file: UploadFile = File(...)):
     global current_df
@@ -58,16 +110,39 @@ async def upload_csv(file: UploadFile = File(...)):
         raise HTTPException(status_code=400, detail="Only CSV files allowed")
     
     content = await file.read()
-    detected = chardet.detect(content)
-    encoding = detected['encoding'] or 'utf-8'
-    
-    try:
-        df = pd.read_csv(StringIO(content.decode(encoding)))
-    except UnicodeDecodeError:
-        df = pd.read_csv(StringIO(content.decode('latin-1')))
+    with span("parse"):
+        detected = chardet.detect(content)
+        encoding = detected['encoding'] or 'utf-8'
+        
+        try:
+            df = pd.read_csv(StringIO(content.decode(encoding)))
+        except UnicodeDecodeError:
+            df = pd.read_csv(StringIO(content.decode('latin-1')))
     
     current_df = df.copy()
     
+    with span("profile"):
+        stats = _profile_dataframe(df)
+    
+    with span("charts"):
+        charts = _upload_charts(df)
+    
+    # Build the JSON response here so encoding of stats and charts is timed too
+    with span("serialize"):
+        # Handle NaN values in sample data
+        sample_data = df.head(10).to_dict('records')
+        for record in sample_data:
+            for key, value in record.items():
+                if pd.isna(value):
+                    record[key] = None
+        
+        response = JSONResponse(jsonable_encoder(
+            {"stats": stats, "charts": charts, "sample_data": sample_data}
+        ))
+    
+    return response
+
+def _profile_dataframe(df):
     # Enhanced statistics with data quality assessment
     missing_count = int(df.isnull().sum().sum())
     total_cells = len(df) * len(df.columns)
@@ -105,9 +180,12 @@ async def upload_csv(file: UploadFile = File(...)):
         "memory_usage": int(df.memory_usage(deep=True).sum()),
         "duplicate_rows": int(df.duplicated().sum())
     }
-    
+    return stats
+
+def _upload_charts(df):
     # Enhanced visualizations
     charts = []
+    numeric_cols = df.select_dtypes(include=['number']).columns
     
     # Correlation heatmap for numeric data
     if len(numeric_cols) > 1:
@@ -148,14 +226,7 @@ async def upload_csv(file: UploadFile = File(...)):
             }
         })
     
-    # Handle NaN values in sample data
-    sample_data = df.head(10).to_dict('records')
-    for record in sample_data:
-        for key, value in record.items():
-            if pd.isna(value):
-                record[key] = None
-    
-    return {"stats": stats, "charts": charts, "sample_data": sample_data}
+    return charts
 
 @app.post("/insights")
 async def get_insights(data: dict):
@@ -226,44 +297,13 @@ async def get_current_stats():
     if current_df is None:
         raise HTTPException(status_code=400, detail="No dataset loaded")
     
-    df = current_df
+    with span("profile"):
+        stats = _profile_dataframe(current_df)
     
-    # Calculate comprehensive statistics
-    missing_count = int(df.isnull().sum().sum())
-    total_cells = len(df) * len(df.columns)
-    quality_score = ((total_cells - missing_count) / total_cells) * 100
+    with span("serialize"):
+        response = JSONResponse(jsonable_encoder(stats))
     
-    # Outlier detection for numeric columns
-    outliers = {}
-    numeric_cols = df.select_dtypes(include=['number']).columns
-    for col in numeric_cols:
-        Q1 = df[col].quantile(0.25)
-        Q3 = df[col].quantile(0.75)
-        IQR = Q3 - Q1
-        outlier_count = len(df[(df[col] < Q1 - 1.5*IQR) | (df[col] > Q3 + 1.5*IQR)])
-        outliers[col] = int(outlier_count)
-    
-    missing_values = {k: int(v) for k, v in df.isnull().sum().to_dict().items()}
-    
-    # Handle NaN values in numeric summary
-    numeric_summary = {}
-    if len(numeric_cols) > 0:
-        desc = df.describe().to_dict()
-        for col, stats_dict in desc.items():
-            numeric_summary[col] = {k: (None if pd.isna(v) else float(v)) for k, v in stats_dict.items()}
-    
-    return {
-        "rows": int(len(df)),
-        "columns": int(len(df.columns)),
-        "column_names": df.columns.tolist(),
-        "data_types": df.dtypes.astype(str).to_dict(),
-        "missing_values": missing_values,
-        "numeric_summary": numeric_summary,
-        "quality_score": float(round(quality_score, 2)),
-        "outliers": outliers,
-        "memory_usage": int(df.memory_usage(deep=True).sum()),
-        "duplicate_rows": int(df.duplicated().sum())
-    }
+    return response
 
 @app.post("/clean-data")
 async def clean_data(options: dict):
@@ -274,45 +314,49 @@ async def clean_data(options: dict):
     df = current_df.copy()
     operations = []
     
-    # Handle missing values
-    if options.get('handle_missing'):
-        method = options.get('missing_method', 'drop')
-        if method == 'drop':
-            df = df.dropna()
-            operations.append("Dropped rows with missing values")
-        elif method == 'fill_mean':
+    with span("clean"):
+        # Handle missing values
+        if options.get('handle_missing'):
+            method = options.get('missing_method', 'drop')
+            if method == 'drop':
+                df = df.dropna()
+                operations.append("Dropped rows with missing values")
+            elif method == 'fill_mean':
+                numeric_cols = df.select_dtypes(include=['number']).columns
+                df[numeric_cols] = df[numeric_cols].fillna(df[numeric_cols].mean())
+                operations.append("Filled missing numeric values with mean")
+            elif method == 'fill_median':
+                numeric_cols = df.select_dtypes(include=['number']).columns
+                df[numeric_cols] = df[numeric_cols].fillna(df[numeric_cols].median())
+                operations.append("Filled missing numeric values with median")
+    
+        # Remove outliers
+        if options.get('remove_outliers'):
             numeric_cols = df.select_dtypes(include=['number']).columns
-            df[numeric_cols] = df[numeric_cols].fillna(df[numeric_cols].mean())
-            operations.append("Filled missing numeric values with mean")
-        elif method == 'fill_median':
-            numeric_cols = df.select_dtypes(include=['number']).columns
-            df[numeric_cols] = df[numeric_cols].fillna(df[numeric_cols].median())
-            operations.append("Filled missing numeric values with median")
-    
-    # Remove outliers
-    if options.get('remove_outliers'):
-        numeric_cols = df.select_dtypes(include=['number']).columns
-        for col in numeric_cols:
-            Q1 = df[col].quantile(0.25)
-            Q3 = df[col].quantile(0.75)
-            IQR = Q3 - Q1
-            df = df[~((df[col] < Q1 - 1.5*IQR) | (df[col] > Q3 + 1.5*IQR))]
-        operations.append("Removed outliers using IQR method")
-    
-    # Remove duplicates
-    if options.get('remove_duplicates'):
-        initial_rows = len(df)
-        df = df.drop_duplicates()
-        removed = initial_rows - len(df)
-        operations.append(f"Removed {removed} duplicate rows")
+            for col in numeric_cols:
+                Q1 = df[col].quantile(0.25)
+                Q3 = df[col].quantile(0.75)
+                IQR = Q3 - Q1
+                df = df[~((df[col] < Q1 - 1.5*IQR) | (df[col] > Q3 + 1.5*IQR))]
+            operations.append("Removed outliers using IQR method")
+    
+        # Remove duplicates
+        if options.get('remove_duplicates'):
+            initial_rows = len(df)
+            df = df.drop_duplicates()
+            removed = initial_rows - len(df)
+            operations.append(f"Removed {removed} duplicate rows")
     
     current_df = df
     
-    return {
-        "message": "Data cleaning completed",
-        "operations": operations,
-        "new_shape": {"rows": len(df), "columns": len(df.columns)}
-    }
+    with span("serialize"):
+        response = JSONResponse(jsonable_encoder({
+            "message": "Data cleaning completed",
+            "operations": operations,
+            "new_shape": {"rows": len(df), "columns": len(df.columns)}
+        }))
+    
+    return response
 
 
 
@@ -340,7 +384,8 @@ async def export_pdf():
     """
     story.append(Paragraph(summary, styles['Normal']))
     
-    doc.build(story)
+    with span("serialize"):
+        doc.build(story)
     buffer.seek(0)
     
     return Response(
@@ -357,7 +402,7 @@ async def export_excel():
     
     buffer = BytesIO()
     
-    with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
+    with span("serialize"), pd.ExcelWriter(buffer, engine='openpyxl') as writer:
         # Main data
         current_df.to_excel(writer, sheet_name='Data', index=False)
         
@@ -389,40 +434,44 @@ async def filter_data(filters: dict):
     
     df = current_df.copy()
     
-    for filter_item in filters.get('filters', []):
-        column = filter_item['column']
-        operator = filter_item['operator']
-        value = filter_item['value']
-        
-        if column not in df.columns:
-            continue
+    with span("filter"):
+        for filter_item in filters.get('filters', []):
+            column = filter_item['column']
+            operator = filter_item['operator']
+            value = filter_item['value']
             
-        if operator == 'equals':
-            df = df[df[column] == value]
-        elif operator == 'greater_than':
-            df = df[df[column] > float(value)]
-        elif operator == 'less_than':
-            df = df[df[column] < float(value)]
-        elif operator == 'contains':
-            df = df[df[column].astype(str).str.contains(str(value), na=False)]
+            if column not in df.columns:
+                continue
+                
+            if operator == 'equals':
+                df = df[df[column] == value]
+            elif operator == 'greater_than':
+                df = df[df[column] > float(value)]
+            elif operator == 'less_than':
+                df = df[df[column] < float(value)]
+            elif operator == 'contains':
+                df = df[df[column].astype(str).str.contains(str(value), na=False)]
     
     # Update current dataset with filtered data
     current_df = df
     
-    # Return filtered stats with NaN handling
-    sample_data = df.head(10).to_dict('records')
-    for record in sample_data:
-        for key, value in record.items():
-            if pd.isna(value):
-                record[key] = None
-    
-    stats = {
-        "rows": len(df),
-        "columns": len(df.columns),
-        "sample_data": sample_data
-    }
+    with span("serialize"):
+        # Return filtered stats with NaN handling
+        sample_data = df.head(10).to_dict('records')
+        for record in sample_data:
+            for key, value in record.items():
+                if pd.isna(value):
+                    record[key] = None
+        
+        stats = {
+            "rows": len(df),
+            "columns": len(df.columns),
+            "sample_data": sample_data
+        }
+        
+        response = JSONResponse(jsonable_encoder({"stats": stats}))
     
-    return {"stats": stats}
+    return response
 
 @app.get("/predictive-insights")
 async def predictive_insights():
@@ -435,36 +484,38 @@ async def predictive_insights():
     
     if len(numeric_cols) >= 2:
         # Clustering analysis
-        try:
-            data_for_clustering = current_df[numeric_cols].dropna()
-            if len(data_for_clustering) > 10:
-                scaler = StandardScaler()
-                scaled_data = scaler.fit_transform(data_for_clustering)
-                
-                kmeans = KMeans(n_clusters=3, random_state=42)
-                clusters = kmeans.fit_predict(scaled_data)
-                
-                insights.append({
-                    "type": "clustering",
-                    "message": f"Identified 3 distinct clusters in your data",
-                    "cluster_sizes": np.bincount(clusters).tolist()
-                })
-        except Exception as e:
-            pass
+        with span("clustering"):
+            try:
+                data_for_clustering = current_df[numeric_cols].dropna()
+                if len(data_for_clustering) > 10:
+                    scaler = StandardScaler()
+                    scaled_data = scaler.fit_transform(data_for_clustering)
+                    
+                    kmeans = KMeans(n_clusters=3, random_state=42)
+                    clusters = kmeans.fit_predict(scaled_data)
+                    
+                    insights.append({
+                        "type": "clustering",
+                        "message": f"Identified 3 distinct clusters in your data",
+                        "cluster_sizes": np.bincount(clusters).tolist()
+                    })
+            except Exception as e:
+                pass
     
     # Correlation insights
     if len(numeric_cols) > 1:
-        corr_matrix = current_df[numeric_cols].corr()
-        high_corr = []
-        for i in range(len(corr_matrix.columns)):
-            for j in range(i+1, len(corr_matrix.columns)):
-                corr_val = corr_matrix.iloc[i, j]
-                if abs(corr_val) > 0.7:
-                    high_corr.append({
-                        "col1": corr_matrix.columns[i],
-                        "col2": corr_matrix.columns[j],
-                        "correlation": round(corr_val, 3)
-                    })
+        with span("correlation"):
+            corr_matrix = current_df[numeric_cols].corr()
+            high_corr = []
+            for i in range(len(corr_matrix.columns)):
+                for j in range(i+1, len(corr_matrix.columns)):
+                    corr_val = corr_matrix.iloc[i, j]
+                    if abs(corr_val) > 0.7:
+                        high_corr.append({
+                            "col1": corr_matrix.columns[i],
+                            "col2": corr_matrix.columns[j],
+                            "correlation": round(corr_val, 3)
+                        })
         
         if high_corr:
             insights.append({
@@ -481,11 +532,20 @@ async def get_3d_visualizations():
     if current_df is None:
         raise HTTPException(status_code=400, detail="No dataset loaded")
     
-    numeric_cols = current_df.select_dtypes(include=['number']).columns
+    with span("charts"):
+        visualizations = _3d_visualizations(current_df)
+    
+    with span("serialize"):
+        response = JSONResponse(jsonable_encoder({"visualizations": visualizations}))
+    
+    return response
+
+def _3d_visualizations(df):
+    numeric_cols = df.select_dtypes(include=['number']).columns
     visualizations = []
     
     if len(numeric_cols) >= 3:
-        df_clean = current_df[numeric_cols[:3]].dropna()
+        df_clean = df[numeric_cols[:3]].dropna()
         
         if len(df_clean) > 0:
             x_col, y_col, z_col = numeric_cols[:3]
@@ -561,7 +621,7 @@ async def get_3d_visualizations():
                 except:
                     pass
     
-    return {"visualizations": visualizations}
+    return visualizations
 
 @app.get("/export/csv")
 async def export_csv():
@@ -569,7 +629,8 @@ async def export_csv():
     if current_df is None:
         raise HTTPException(status_code=400, detail="No dataset loaded")
     
-    csv_data = current_df.to_csv(index=False)
+    with span("serialize"):
+        csv_data = current_df.to_csv(index=False)
     
     return Response(
         content=csv_data,
@@ -638,7 +699,8 @@ async def export_pdf_enhanced():
             """
             story.append(Paragraph(col_stats, styles['Normal']))
     
-    doc.build(story)
+    with span("serialize"):
+        doc.build(story)
     buffer.seek(0)
     
     return Response(
@@ -0,0 +1,220 @@
+import os
+import time
+import logging
+import threading
+import cProfile
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+
+try:
+    from pyinstrument import Profiler
+except ImportError:
+    Profiler = None
+
+# Histogram buckets in seconds, shared by request latency and phase spans
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Response size buckets in bytes
+SIZE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024, 100 * 1024 * 1024)
+
+# Spans recorded during the current request, read back by the middleware
+_request_spans = ContextVar("request_spans", default=None)
+
+_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class Registry:
+    def __init__(self):
+        self.requests = {}
+        self.latency = {}
+        self.response_size = {}
+        self.phases = {}
+
+    def reset(self):
+        with _lock:
+            self.requests.clear()
+            self.latency.clear()
+            self.response_size.clear()
+            self.phases.clear()
+
+    def observe_request(self, method, path, status, duration, size):
+        with _lock:
+            key = (method, path, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.latency.setdefault((method, path), Histogram(LATENCY_BUCKETS)).observe(duration)
+            if size is not None:
+                self.response_size.setdefault((method, path), Histogram(SIZE_BUCKETS)).observe(size)
+
+    def observe_phase(self, path, phase, duration):
+        with _lock:
+            self.phases.setdefault((path, phase), Histogram(LATENCY_BUCKETS)).observe(duration)
+
+    def render(self):
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = []
+        with _lock:
+            lines.append("# HELP http_requests_total Total HTTP requests by method, path and status.")
+            lines.append("# TYPE http_requests_total counter")
+            for (method, path, status), value in sorted(self.requests.items()):
+                labels = _labels(method=method, path=path, status=status)
+                lines.append(f"http_requests_total{{{labels}}} {value}")
+
+            _render_histogram(lines, "http_request_duration_seconds",
+                              "HTTP request latency in seconds.",
+                              {k: _labels(method=k[0], path=k[1]) for k in self.latency},
+                              self.latency)
+            _render_histogram(lines, "http_response_size_bytes",
+                              "HTTP response body size in bytes.",
+                              {k: _labels(method=k[0], path=k[1]) for k in self.response_size},
+                              self.response_size)
+            _render_histogram(lines, "endpoint_phase_duration_seconds",
+                              "Time spent in each instrumented phase of an endpoint.",
+                              {k: _labels(path=k[0], phase=k[1]) for k in self.phases},
+                              self.phases)
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(**labels):
+    return ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+
+
+def _render_histogram(lines, name, help_text, labels, histograms):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for key in sorted(histograms):
+        hist = histograms[key]
+        base = labels[key]
+        for bound, count in zip(hist.buckets, hist.counts):
+            lines.append(f'{name}_bucket{{{base},le="{bound}"}} {count}')
+        lines.append(f'{name}_bucket{{{base},le="+Inf"}} {hist.count}')
+        lines.append(f"{name}_sum{{{base}}} {hist.sum}")
+        lines.append(f"{name}_count{{{base}}} {hist.count}")
+
+
+registry = Registry()
+
+
+def start_request():
+    """Begin collecting spans for the current request."""
+    spans = []
+    _request_spans.set(spans)
+    return spans
+
+
+@contextmanager
+def span(phase):
+    """Time a phase of the current request, e.g. parse, profile, charts, serialize."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((phase, duration))
+
+
+def server_timing(spans):
+    """Format recorded spans as a Server-Timing header value."""
+    return ", ".join(f"{phase};dur={duration * 1000:.2f}" for phase, duration in spans)
+
+
+def profiling_enabled(request):
+    """PROFILE_REQUESTS=1 profiles every request; PROFILE_REQUESTS=allow profiles
+    only requests that pass ?profile=1. Profiling is off otherwise."""
+    mode = os.getenv("PROFILE_REQUESTS", "").lower()
+    if mode in ("1", "true", "yes"):
+        return True
+    if mode == "allow":
+        return request.query_params.get("profile") in ("1", "true")
+    return False
+
+
+# cProfile and pyinstrument both hook the interpreter per thread and every async
+# handler runs on the event-loop thread, so only one request can be profiled at
+# a time. Requests that overlap a running profile are served unprofiled.
+_profiler_lock = threading.Lock()
+
+
+def start_profiler(path):
+    """Start profiling a request, or return None if a profile is already running."""
+    if not _profiler_lock.acquire(blocking=False):
+        return None
+    try:
+        profiler = RequestProfiler(path)
+        profiler.start()
+    except (ValueError, RuntimeError):
+        # Another tool already holds the profiling hook; never fail the request over it
+        _profiler_lock.release()
+        return None
+    return profiler
+
+
+class RequestProfiler:
+    """Profile one request with pyinstrument when available, otherwise cProfile."""
+
+    def __init__(self, path):
+        self.path = path
+        self.use_pyinstrument = Profiler is not None and os.getenv("PROFILER", "pyinstrument") == "pyinstrument"
+        if self.use_pyinstrument:
+            self.profiler = Profiler(async_mode="enabled")
+        else:
+            self.profiler = cProfile.Profile()
+
+    def start(self):
+        if self.use_pyinstrument:
+            self.profiler.start()
+        else:
+            self.profiler.enable()
+
+    def stop(self):
+        """Stop profiling and free the slot for the next profiled request."""
+        try:
+            if self.use_pyinstrument:
+                self.profiler.stop()
+            else:
+                self.profiler.disable()
+        finally:
+            _profiler_lock.release()
+
+    def save(self):
+        """Write the dump to PROFILE_DIR, returning its file name, or None if it can't be written."""
+        out_dir = os.getenv("PROFILE_DIR", "profiles")
+        name = self.path.strip("/").replace("/", "_") or "root"
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        try:
+            os.makedirs(out_dir, exist_ok=True)
+            if self.use_pyinstrument:
+                filename = f"{name}-{stamp}.html"
+                with open(os.path.join(out_dir, filename), "w") as f:
+                    f.write(self.profiler.output_html())
+            else:
+                filename = f"{name}-{stamp}.prof"
+                self.profiler.dump_stats(os.path.join(out_dir, filename))
+        except Exception:
+            # A failed dump must never fail the request it profiled
+            logger.exception("Could not write profile for %s to %s", self.path, out_dir)
+            return None
+        return filename
@@ -0,0 +1,148 @@
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import metrics
+
+CSV = b"a,b,c\n1,2,x\n3,4,y\n5,,x\n7,8,z\n"
+
+
+@pytest.fixture(autouse=True)
+def reset_state(monkeypatch):
+    metrics.registry.reset()
+    main.current_df = None
+    monkeypatch.delenv("PROFILE_REQUESTS", raising=False)
+    yield
+    main.current_df = None
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app, raise_server_exceptions=False)
+
+
+def upload(client):
+    return client.post("/upload", files={"file": ("data.csv", CSV, "text/csv")})
+
+
+def test_histogram_buckets_are_cumulative():
+    hist = metrics.Histogram((0.1, 1.0))
+    hist.observe(0.05)
+    hist.observe(0.5)
+    hist.observe(5.0)
+    assert hist.counts == [1, 2]
+    assert hist.count == 3
+    assert hist.sum == pytest.approx(5.55)
+
+
+def test_label_values_are_escaped():
+    assert metrics._labels(path='a"b\\c\nd') == 'path="a\\"b\\\\c\\nd"'
+
+
+def test_span_records_into_current_request():
+    spans = metrics.start_request()
+    with metrics.span("parse"):
+        pass
+    assert [phase for phase, _ in spans] == ["parse"]
+    assert metrics.server_timing([("parse", 0.0125)]) == "parse;dur=12.50"
+
+
+def test_metrics_output_after_request(client):
+    assert upload(client).status_code == 200
+    body = client.get("/metrics").text
+
+    assert "# TYPE http_requests_total counter" in body
+    assert 'http_requests_total{method="POST",path="/upload",status="200"} 1' in body
+    assert 'http_request_duration_seconds_bucket{method="POST",path="/upload",le="+Inf"} 1' in body
+    assert 'http_request_duration_seconds_count{method="POST",path="/upload"} 1' in body
+    assert 'http_response_size_bytes_count{method="POST",path="/upload"} 1' in body
+    assert 'endpoint_phase_duration_seconds_count{path="/upload",phase="parse"} 1' in body
+
+
+def test_upload_sets_server_timing_header(client):
+    response = upload(client)
+    phases = [part.split(";")[0] for part in response.headers["Server-Timing"].split(", ")]
+    assert phases == ["parse", "profile", "charts", "serialize"]
+
+
+@pytest.mark.parametrize("method,path,body,phases", [
+    ("GET", "/current-stats", None, ["profile", "serialize"]),
+    ("GET", "/3d-visualizations", None, ["charts", "serialize"]),
+    ("POST", "/clean-data", {"remove_duplicates": True}, ["clean", "serialize"]),
+    ("POST", "/filter-data", {"filters": []}, ["filter", "serialize"]),
+])
+def test_dataset_endpoints_set_server_timing_header(client, method, path, body, phases):
+    upload(client)
+    response = client.request(method, path, json=body)
+    assert response.status_code == 200
+    assert [part.split(";")[0] for part in response.headers["Server-Timing"].split(", ")] == phases
+
+
+def test_handler_exception_is_counted_as_500(client):
+    upload(client)
+    response = client.post("/filter-data", json={
+        "filters": [{"column": "a", "operator": "greater_than", "value": "abc"}]
+    })
+    assert response.status_code == 500
+
+    body = client.get("/metrics").text
+    assert 'http_requests_total{method="POST",path="/filter-data",status="500"} 1' in body
+
+
+def test_unmatched_requests_share_one_label(client):
+    assert client.get("/no-such-route/123").status_code == 404
+
+    body = client.get("/metrics").text
+    assert 'http_requests_total{method="GET",path="<unmatched>",status="404"} 1' in body
+    assert "/no-such-route" not in body
+
+
+def test_profile_query_param_ignored_unless_allowed(client):
+    response = client.get("/?profile=1")
+    assert "X-Profile-File" not in response.headers
+
+
+def test_profile_query_param_when_allowed(client, monkeypatch, tmp_path):
+    monkeypatch.setenv("PROFILE_REQUESTS", "allow")
+    monkeypatch.setenv("PROFILER", "cprofile")
+    monkeypatch.setenv("PROFILE_DIR", str(tmp_path))
+
+    assert "X-Profile-File" not in client.get("/").headers
+
+    filename = client.get("/?profile=1").headers["X-Profile-File"]
+    assert os.sep not in filename
+    assert (tmp_path / filename).exists()
+
+
+def test_overlapping_profile_is_skipped(client, monkeypatch, tmp_path):
+    monkeypatch.setenv("PROFILE_REQUESTS", "1")
+    monkeypatch.setenv("PROFILER", "cprofile")
+    monkeypatch.setenv("PROFILE_DIR", str(tmp_path))
+
+    # Simulate another request holding the profiler
+    assert metrics._profiler_lock.acquire(blocking=False)
+    try:
+        response = client.get("/")
+    finally:
+        metrics._profiler_lock.release()
+
+    assert response.status_code == 200
+    assert "X-Profile-File" not in response.headers
+
+
+def test_unwritable_profile_dir_does_not_fail_request(client, monkeypatch, tmp_path):
+    blocker = tmp_path / "not-a-dir"
+    blocker.write_text("")
+    monkeypatch.setenv("PROFILE_REQUESTS", "1")
+    monkeypatch.setenv("PROFILER", "cprofile")
+    monkeypatch.setenv("PROFILE_DIR", str(blocker / "profiles"))
+
+    response = client.get("/")
+    assert response.status_code == 200
+    assert "X-Profile-File" not in response.headers
+
+    monkeypatch.delenv("PROFILE_REQUESTS")
+    body = client.get("/metrics").text
+    assert 'http_requests_total{method="GET",path="/",status="200"} 1' in body